@@ -1,9 +1,16 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
 import pandas as pd
 import plotly.express as px
-from dash import dcc, html, Input, Output, State, ALL, MATCH, no_update, ctx
+import plotly.graph_objects as go
+from dash import dcc, html, Input, Output, State, ALL, MATCH, no_update
 
 
-CARD_STYLE = {
+CARD_STYLE = MappingProxyType({
     'border': '1px solid #e0e0e0',
     'borderRadius': '14px',
     'padding': '15px',
@@ -11,7 +18,86 @@ CARD_STYLE = {
     'textAlign': 'center',
     'backgroundColor': '#fafafa',
     'boxShadow': '1px 1px 6px rgba(0, 0, 0, 0.1)'
+})
+CARD_VALUE_STYLE = MappingProxyType({'color': '#1f77b4', 'fontWeight': 'bold', 'margin': 0})
+# Готовые пары (стиль карточки, стиль значения) передаются по ссылке:
+# обычная карточка и подсветка диагноза в анализе мочи — красная (POSITIVE)
+# или зелёная.
+PLAIN_CARD_STYLES = (dict(CARD_STYLE), dict(CARD_VALUE_STYLE))
+DIAGNOSIS_CARD_STYLES = {
+    True: (
+        {**CARD_STYLE, 'backgroundColor': '#ffe5e5', 'border': '2px solid #d62728'},
+        {**CARD_VALUE_STYLE, 'color': '#d62728'}
+    ),
+    False: (
+        {**CARD_STYLE, 'backgroundColor': '#e5ffe5', 'border': '2px solid #2ca02c'},
+        {**CARD_VALUE_STYLE, 'color': '#2ca02c'}
+    )
+}
+# Стили ниже одинаковы для всех карточек и секций и передаются по ссылке.
+CARD_TITLE_STYLE = {'marginBottom': '4px', 'color': '#7f3f00'}
+CARD_BUTTON_STYLE = {'background': 'transparent', 'border': 'none', 'padding': 0, 'cursor': 'pointer'}
+CARDS_ROW_STYLE = {'display': 'flex', 'flexWrap': 'wrap', 'gap': '15px', 'marginTop': '10px'}
+DETAILS_STYLE = {'marginBottom': '12px', 'border': '1px solid #e0e0e0', 'borderRadius': '8px', 'padding': '10px'}
+DETAILS_SUMMARY_STYLE = {'fontSize': '16px', 'fontWeight': '500'}
+SOURCE_SECTION_STYLE = {
+    'padding': '20px',
+    'border': '1px solid #e0e0e0',
+    'borderRadius': '12px',
+    'backgroundColor': 'white',
+    'boxShadow': '2px 2px 8px rgba(0,0,0,0.1)'
+}
+SOURCE_TITLE_STYLE = {'color': '#1f77b4', 'marginBottom': '5px'}
+SOURCE_PATIENT_STYLE = {'color': '#555555', 'marginBottom': '15px', 'fontSize': '18px', 'fontWeight': '500'}
+SOURCE_ROWS_STYLE = {'display': 'flex', 'flexDirection': 'column', 'gap': '10px'}
+DETAILS_PLACEHOLDER = 'Загрузка...'
+SCATTER_FIGURE_URL = '/figures/global-scatter.json'
+BOX_PLOTS_URL = '/figures/box-plots.json'
+# Шаблон plotly_white в виде JSON: график истории собирается обычным dict
+# и ссылается на него, не проходя валидацию graph_objects.
+HISTORY_TEMPLATE = json.loads(go.Figure(layout_template='plotly_white').to_json())['layout']['template']
+
+# Стили индикатора нормы общие для всех вызовов build_range_gauge;
+# на каждый вызов копируется только стиль маркера (меняется `left`).
+GAUGE_STYLE = {'marginTop': '10px', 'marginBottom': '10px'}
+GAUGE_TITLE_STYLE = {'color': '#d62728', 'fontWeight': 'bold', 'marginBottom': '6px'}
+GAUGE_BAR_STYLE = {
+    'position': 'relative',
+    'width': '100%',
+    'height': '36px',
+    'borderRadius': '18px',
+    'background': 'linear-gradient(90deg, #ffb347 0%, #7fff8a 50%, #ffb347 100%)'
 }
+GAUGE_MARKER_STYLE = MappingProxyType({
+    'position': 'absolute',
+    'top': '50%',
+    'transform': 'translate(-50%, -50%)',
+    'width': '32px',
+    'height': '32px',
+    'borderRadius': '50%',
+    'border': '2px solid #d62728',
+    'backgroundColor': 'white',
+    'display': 'flex',
+    'alignItems': 'center',
+    'justifyContent': 'center',
+    'fontWeight': 'bold',
+    'zIndex': 2
+})
+_GAUGE_STICK_STYLE = {
+    'position': 'absolute',
+    'top': 0,
+    'transform': 'translateX(-50%)',
+    'width': '2px',
+    'height': '100%',
+    'backgroundColor': 'rgba(255, 255, 255, 0.8)',
+    'zIndex': 1
+}
+GAUGE_LOW_STICK_STYLE = {**_GAUGE_STICK_STYLE, 'left': '33.3%'}
+GAUGE_HIGH_STICK_STYLE = {**_GAUGE_STICK_STYLE, 'left': '66.6%'}
+_GAUGE_LABEL_STYLE = {'position': 'absolute', 'transform': 'translate(-50%, 0)', 'color': '#555'}
+GAUGE_LOW_LABEL_STYLE = {**_GAUGE_LABEL_STYLE, 'left': '33.3%'}
+GAUGE_HIGH_LABEL_STYLE = {**_GAUGE_LABEL_STYLE, 'left': '66.6%'}
+GAUGE_LABELS_ROW_STYLE = {'position': 'relative', 'height': '24px', 'marginTop': '6px'}
 
 BLOOD_FILES = {'анализ_крови.csv', 'анализ_крови.xlsx'}
 URINE_FILES = {'анализ_мочи.csv', 'анализ_мочи.xlsx'}
@@ -25,18 +111,30 @@ REFERENCE_COLUMNS = {
     'Гемоглобин': ('Гемоглобин мин норма', 'Гемоглобин макс норма'),
     'Тромбоциты': ('Тромбоциты мин норма', 'Тромбоциты макс норма')
 }
+GAUGE_COLUMNS = tuple(
+    column for metric, bounds in REFERENCE_COLUMNS.items() for column in (metric, *bounds)
+)
+HIDDEN_CARD_COLUMNS = frozenset({
+    'ID', 'Дата', 'Date', 'Имя', 'Пол',
+    'Гемоглобин', 'Гемоглобин мин норма', 'Гемоглобин макс норма',
+    'Тромбоциты', 'Тромбоциты мин норма', 'Тромбоциты макс норма'
+})
 
 
 def _to_float(value):
+    # Колонки индикаторов приводятся к числам при загрузке (см. main.py),
+    # поэтому разбор строк остаётся только запасным путём.
     if value is None or value == '':
         return None
+    if isinstance(value, (int, float, np.number)):
+        return None if pd.isna(value) else float(value)
     try:
         return float(str(value).replace(',', '.'))
     except ValueError:
         return None
 
 
-def build_range_gauge(row, value_key, min_key, max_key, title):
+def build_range_gauge(value, min_norm, max_norm, title, position=None):
     """Render a traffic-light style indicator for lab results.
 
     Медицинские данные чувствительны, поэтому мы визуализируем их так,
@@ -44,104 +142,145 @@ def build_range_gauge(row, value_key, min_key, max_key, title):
     Центральная зона (1/3–2/3 длины полосы) соответствует «норме»,
     крайние трети — зонам риска. Значение нормализуется и
     помещается в соответствующий сегмент.
+
+    `position` можно передать заранее посчитанной (см. `gauge_arrays`).
     """
-    value = _to_float(row.get(value_key))
-    min_norm = _to_float(row.get(min_key))
-    max_norm = _to_float(row.get(max_key))
+    value = _to_float(value)
+    min_norm = _to_float(min_norm)
+    max_norm = _to_float(max_norm)
 
     if value is None or min_norm is None or max_norm is None or max_norm <= min_norm:
         return html.Div(f'Нет данных по показателю {title}', style={'color': '#777', 'marginTop': '10px'})
 
-    if value <= min_norm:
-        position = 0
-    elif value >= max_norm:
-        position = 100
-    else:
-        ratio = (value - min_norm) / (max_norm - min_norm)
-        position = 33.3 + ratio * 33.4  # place within middle third
-
-    bar_style = {
-        'position': 'relative',
-        'width': '100%',
-        'height': '36px',
-        'borderRadius': '18px',
-        'background': 'linear-gradient(90deg, #ffb347 0%, #7fff8a 50%, #ffb347 100%)'
-    }
-    marker_style = {
-        'position': 'absolute',
-        'top': '50%',
-        'left': f'{position:.2f}%',
-        'transform': 'translate(-50%, -50%)',
-        'width': '32px',
-        'height': '32px',
-        'borderRadius': '50%',
-        'border': '2px solid #d62728',
-        'backgroundColor': 'white',
-        'display': 'flex',
-        'alignItems': 'center',
-        'justifyContent': 'center',
-        'fontWeight': 'bold',
-        'zIndex': 2
-    }
-    stick_style = lambda offset: {
-        'position': 'absolute',
-        'top': 0,
-        'left': offset,
-        'transform': 'translateX(-50%)',
-        'width': '2px',
-        'height': '100%',
-        'backgroundColor': 'rgba(255, 255, 255, 0.8)',
-        'zIndex': 1
-    }
+    if position is None:
+        position = float(gauge_positions(value, min_norm, max_norm))
+
+    marker_style = {**GAUGE_MARKER_STYLE, 'left': f'{position:.2f}%'}
 
     border_labels = html.Div(
         [
-            html.Span(
-                f"{min_norm:.1f}",
-                style={
-                    'position': 'absolute',
-                    'left': '33.3%',
-                    'transform': 'translate(-50%, 0)',
-                    'color': '#555'
-                }
-            ),
-            html.Span(
-                f"{max_norm:.1f}",
-                style={
-                    'position': 'absolute',
-                    'left': '66.6%',
-                    'transform': 'translate(-50%, 0)',
-                    'color': '#555'
-                }
-            )
+            html.Span(f"{min_norm:.1f}", style=GAUGE_LOW_LABEL_STYLE),
+            html.Span(f"{max_norm:.1f}", style=GAUGE_HIGH_LABEL_STYLE)
         ],
-        style={'position': 'relative', 'height': '24px', 'marginTop': '6px'}
+        style=GAUGE_LABELS_ROW_STYLE
     )
 
     return html.Div([
-        html.Div(title, style={'color': '#d62728', 'fontWeight': 'bold', 'marginBottom': '6px'}),
+        html.Div(title, style=GAUGE_TITLE_STYLE),
         html.Div(
             [
                 html.Div(
                     [
-                        html.Div('', style=stick_style('33.3%')),
-                        html.Div('', style=stick_style('66.6%')),
+                        html.Div('', style=GAUGE_LOW_STICK_STYLE),
+                        html.Div('', style=GAUGE_HIGH_STICK_STYLE),
                         html.Div(f"{value:.1f}", style=marker_style)
                     ],
-                    style=bar_style
+                    style=GAUGE_BAR_STYLE
                 ),
                 border_labels
             ]
         )
-    ], style={'marginTop': '10px', 'marginBottom': '10px'})
+    ], style=GAUGE_STYLE)
+
 
+def build_hemoglobin_gauge(value, min_norm, max_norm, position=None):
+    return build_range_gauge(value, min_norm, max_norm, 'Гемоглобин', position)
 
-def build_hemoglobin_gauge(row):
-    return build_range_gauge(row, 'Гемоглобин', 'Гемоглобин мин норма', 'Гемоглобин макс норма', 'Гемоглобин')
 
+def build_platelet_gauge(value, min_norm, max_norm, position=None):
+    return build_range_gauge(value, min_norm, max_norm, 'Тромбоциты', position)
 
-def build_platelet_gauge(row):
-    return build_range_gauge(row, 'Тромбоциты', 'Тромбоциты мин норма', 'Тромбоциты макс норма', 'Тромбоциты')
+
+def gauge_positions(values, min_norms, max_norms):
+    """Положение маркера (0–100 %) для целой колонки значений.
+
+    Ниже нормы — левый край, выше — правый, внутри нормы значение
+    линейно ложится в среднюю треть полосы. Строки без корректной нормы
+    дают NaN: для них индикатор всё равно показывает «Нет данных».
+    """
+    values = np.asarray(values, dtype=float)
+    min_norms = np.asarray(min_norms, dtype=float)
+    max_norms = np.asarray(max_norms, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inside = 33.3 + (values - min_norms) / (max_norms - min_norms) * 33.4  # place within middle third
+    return np.where(values <= min_norms, 0.0, np.where(values >= max_norms, 100.0, inside))
+
+
+def gauge_arrays(subset: pd.DataFrame):
+    """Достаёт колонки индикаторов как ndarray один раз на источник.
+
+    Возвращает `{показатель: (значения, мин. норма, макс. норма, позиции)}`;
+    отсутствующая колонка заменяется на None. Позиции маркеров считаются
+    одним векторным проходом, если все три колонки числовые.
+    """
+    arrays = {}
+    for metric, bounds in REFERENCE_COLUMNS.items():
+        columns = tuple(
+            subset[column].to_numpy() if column in subset.columns else None
+            for column in (metric, *bounds)
+        )
+        positions = None
+        if all(column is not None and column.dtype.kind in 'iuf' for column in columns):
+            positions = gauge_positions(*columns)
+        arrays[metric] = (*columns, positions)
+    return arrays
+
+
+def gauge_values_at(arrays, metric, row_idx):
+    return tuple(None if column is None else column[row_idx] for column in arrays[metric])
+
+
+def positive_diagnosis_mask(subset: pd.DataFrame):
+    """Маска строк с диагнозом POSITIVE, одним векторным проходом по колонке.
+
+    Нестроковые значения (пропуски, числа) считаются отрицательным
+    результатом; без колонки `Диагноз` возвращается None.
+    """
+    if 'Диагноз' not in subset.columns:
+        return None
+    diagnosis = subset['Диагноз']
+    if not (pd.api.types.is_object_dtype(diagnosis) or pd.api.types.is_string_dtype(diagnosis)):
+        return np.zeros(len(subset), dtype=bool)
+    return diagnosis.str.strip().str.upper().eq('POSITIVE').fillna(False).to_numpy(dtype=bool)
+
+
+def serialize_figure(fig):
+    """Возвращает фигуру как JSON-совместимый dict.
+
+    `to_json` один раз кодирует массивы numpy (base64 typed arrays), и
+    дальше Dash отправляет обычный словарь, не обходя дерево Figure и
+    не преобразуя массивы при каждом ответе.
+    """
+    return json.loads(fig.to_json())
+
+
+def summarize_box(values):
+    """Считает статистики box-plot одним проходом numpy.
+
+    Квартили, усы (крайние точки в пределах 1.5·IQR), ширина выемки и
+    выбросы вычисляются на сервере один раз, поэтому в браузер уходит
+    несколько чисел и выбросы, а не весь массив значений. Квартили
+    считаются методом Hazen — так же, как `quartilemethod='linear'` в
+    plotly.js, чтобы значения совпадали с box-plot, построенным в браузере.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return None
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75], method='hazen')
+    iqr = q3 - q1
+    low_limit, high_limit = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    inside = values[(values >= low_limit) & (values <= high_limit)]
+    return {
+        'q1': float(q1),
+        'median': float(median),
+        'q3': float(q3),
+        'lowerfence': float(inside.min()),
+        'upperfence': float(inside.max()),
+        'notchspan': float(1.57 * iqr / np.sqrt(values.size)),
+        'outliers': values[(values < low_limit) | (values > high_limit)].tolist()
+    }
 
 
 def empty_gauge_figure(metric_name=''):
@@ -159,8 +298,20 @@ def empty_gauge_figure(metric_name=''):
     }
 
 
-def build_metric_gauge_block(row, row_identifier, metric_id, builder_func, source_name):
-    gauge_content = builder_func(row)
+def _json_values(values):
+    # datetime64.tolist() возвращает наносекунды, поэтому даты (например, из
+    # xlsx) отдаются ISO-строками. pd.isna, а не `value != value`: в
+    # string-колонках пропуск — это pd.NA.
+    if values.dtype.kind == 'M':
+        values = pd.DatetimeIndex(values).astype(object).to_numpy()
+    return [
+        None if pd.isna(value) else (value.isoformat() if hasattr(value, 'isoformat') else value)
+        for value in values.tolist()
+    ]
+
+
+def build_metric_gauge_block(gauge_values, row_identifier, metric_id, builder_func, source_name):
+    gauge_content = builder_func(*gauge_values)
     button_id = {'type': 'gauge-toggle', 'row': row_identifier, 'metric': metric_id, 'source': source_name}
     graph_id = {'type': 'gauge-plot', 'row': row_identifier, 'metric': metric_id, 'source': source_name}
 
@@ -180,6 +331,15 @@ def build_metric_gauge_block(row, row_identifier, metric_id, builder_func, sourc
 
 
 def format_value(value):
+    # Частые типы разбираются без диспетчеризации pd.isna: NaN — единственное
+    # значение, не равное самому себе.
+    value_type = type(value)
+    if value_type is str:
+        return value
+    if value_type is float:
+        return 'N/A' if value != value else f"{value:.2f}"
+    if value_type is int or value_type is bool:
+        return str(value)
     if pd.isna(value):
         return 'N/A'
     if isinstance(value, float):
@@ -187,118 +347,193 @@ def format_value(value):
     return str(value)
 
 
+def format_frame(df_source: pd.DataFrame) -> pd.DataFrame:
+    """Преобразует все значения таблицы в строки для карточек.
+
+    Повторяет правила `format_value`, но для float-колонок делает это
+    одной операцией над столбцом, поэтому при отрисовке карточек остаётся
+    только взять готовую строку.
+    """
+    formatted = {}
+    for column in df_source.columns:
+        series = df_source[column]
+        formatted[column] = _column_formatter(series)(series)
+    return pd.DataFrame(formatted, index=df_source.index)
+
+
+def _format_float_column(series):
+    return series.map('{:.2f}'.format).where(series.notna(), 'N/A')
+
+
+def _format_plain_column(series):
+    return series.astype(str)
+
+
+def _format_object_column(series):
+    return series.map(format_value)
+
+
+def _column_formatter(series):
+    """Выбирает форматтер по dtype колонки, а не по типу каждого значения."""
+    if pd.api.types.is_float_dtype(series):
+        return _format_float_column
+    if series.dtype.kind in 'iub':
+        # numpy int/bool не содержат NaN, поэтому достаточно str().
+        return _format_plain_column
+    return _format_object_column
+
+
 def build_patient_options(df_source: pd.DataFrame):
-    unique_patients = df_source['ID'].drop_duplicates()
-    options = []
-    for idx in unique_patients:
-        options.append({
-            'label': f"Пациент: ID {idx}",
-            'value': idx
-        })
-    return options
+    unique_patients = df_source['ID'].dropna().drop_duplicates()
+    labels = ('Пациент: ID ' + unique_patients.astype(str)).tolist()
+    return [{'label': label, 'value': idx} for label, idx in zip(labels, unique_patients.tolist())]
 
 
-def build_patient_result_sections(patient_df: pd.DataFrame, source_column_map):
-    """Собирает карточки показателей для всех таблиц выбранного пациента.
+def build_display_column_map(source_column_map, available_columns):
+    """Заранее вычисляет список карточек для каждого источника.
 
-    - Группируем строки по Source_File, чтобы врач видел первичный источник.
-    - Для каждого источника выводим имя/пол пациента, список исследований
-      и, при необходимости, специализированные визуализации (гемоглобин,
-      тромбоциты) с историческими графиками.
+    Колонки источника фильтруются от служебных полей и пересекаются с
+    колонками объединённого DataFrame один раз при старте, а не при
+    каждом выборе пациента. Источники с одинаковой схемой получают общий
+    список.
     """
-    if patient_df.empty:
-        return html.P('Нет данных по выбранному пациенту.', style={'color': '#555555'})
+    available = set(available_columns)
+    by_schema = {}
+    display_column_map = {}
+    for source_name, columns in source_column_map.items():
+        schema = tuple(columns)
+        if schema not in by_schema:
+            by_schema[schema] = [col for col in schema if col not in HIDDEN_CARD_COLUMNS and col in available]
+        display_column_map[source_name] = by_schema[schema]
+    return display_column_map
 
-    date_column = 'Дата' if 'Дата' in patient_df.columns else ('Date' if 'Date' in patient_df.columns else None)
+
+def _date_column(columns):
+    return 'Дата' if 'Дата' in columns else ('Date' if 'Date' in columns else None)
+
+
+def group_patient_sources(df_source: pd.DataFrame):
+    """Раскладывает строки по парам (пациент, источник) за один проход.
+
+    Таблица сортируется по дате (свежие анализы сверху) один раз при
+    старте, после чего выбор пациента не требует groupby и сортировки.
+    Возвращает `{Patient_Key: {Source_File: subset}}`; источники внутри
+    пациента идут в алфавитном порядке.
+    """
+    date_column = _date_column(df_source.columns)
     if date_column:
-        patient_df = patient_df.sort_values(by=date_column, ascending=False)
+        df_source = df_source.sort_values(by=date_column, ascending=False, kind='stable')
 
-    sections = []
-    for source_name, subset in patient_df.groupby('Source_File'):
-        source_columns = source_column_map.get(source_name, subset.columns.tolist())
-        display_columns = [
-            col for col in source_columns
-            if col not in (
-                'ID', 'Дата', 'Date', 'Имя', 'Пол',
-                'Гемоглобин', 'Гемоглобин мин норма', 'Гемоглобин макс норма',
-                'Тромбоциты', 'Тромбоциты мин норма', 'Тромбоциты макс норма'
-            )
-        ]
+    source_index = {}
+    for (patient_key, source_name), subset in df_source.groupby(['Patient_Key', 'Source_File'], observed=True):
+        source_index.setdefault(patient_key, {})[source_name] = subset
+    return source_index
 
-        rows = []
-        header_name = subset.iloc[0].get('Имя', 'Имя неизвестно')
-        header_gender = subset.iloc[0].get('Пол', 'Пол неизвестен')
-        for row_idx, (_, row) in enumerate(subset.iterrows()):
-            cards = []
-            for column in display_columns:
-                if column not in subset.columns:
-                    continue
-                card_style = CARD_STYLE.copy()
-                value_style = {'color': '#1f77b4', 'fontWeight': 'bold', 'margin': 0}
-                if column == 'Диагноз' and source_name in URINE_FILES:
-                    diagnosis = str(row[column]).strip().upper() if isinstance(row[column], str) else ''
-                    if diagnosis == 'POSITIVE':
-                        card_style['backgroundColor'] = '#ffe5e5'
-                        card_style['border'] = '2px solid #d62728'
-                        value_style['color'] = '#d62728'
-                    else:
-                        card_style['backgroundColor'] = '#e5ffe5'
-                        card_style['border'] = '2px solid #2ca02c'
-                        value_style['color'] = '#2ca02c'
-                cards.append(
-                    html.Button(
-                        html.Div([
-                            html.H5(column.replace('_', ' '), style={'marginBottom': '4px', 'color': '#7f3f00'}),
-                            html.P(format_value(row[column]), style=value_style)
-                        ], style=card_style),
-                        id={'type': 'metric-card', 'metric': column},
-                        n_clicks=0,
-                        style={'background': 'transparent', 'border': 'none', 'padding': 0, 'cursor': 'pointer'}
-                    )
-                )
 
-            date_value = row.get('Дата') or row.get('Date') or 'N/A'
-            detail_children = [html.Summary(f"{source_name} — {date_value}", style={'fontSize': '16px', 'fontWeight': '500'})]
-            row_identifier = f"{source_name}-{row_idx}"
-            if source_name in BLOOD_FILES:
-                detail_children.append(
-                    build_metric_gauge_block(row, row_identifier, 'Гемоглобин', build_hemoglobin_gauge, source_name)
-                )
-                detail_children.append(
-                    build_metric_gauge_block(row, row_identifier, 'Тромбоциты', build_platelet_gauge, source_name)
-                )
-            detail_children.append(
-                html.Div(cards, style={'display': 'flex', 'flexWrap': 'wrap', 'gap': '15px', 'marginTop': '10px'})
+def _summary_dates(subset: pd.DataFrame):
+    """Даты строк для заголовков `<details>`: `Дата`, иначе `Date`, иначе N/A."""
+    columns = [subset[column].tolist() for column in ('Дата', 'Date') if column in subset.columns]
+    if not columns:
+        return ['N/A'] * len(subset)
+    return [next((value for value in values if value), 'N/A') for values in zip(*columns)]
+
+
+def _display_columns_for(source_name, subset, display_column_map):
+    display_columns = display_column_map.get(source_name)
+    if display_columns is None:
+        display_columns = [col for col in subset.columns if col not in HIDDEN_CARD_COLUMNS]
+    return display_columns
+
+
+def build_result_row_body(
+    formatted_row,
+    display_columns,
+    source_name,
+    row_identifier,
+    gauge_values=None,
+    positive_diagnosis=False
+):
+    """Содержимое одного `<details>`: индикаторы норм и карточки показателей.
+
+    `positive_diagnosis` — значение `positive_diagnosis_mask` для строки.
+    """
+    diagnosis_styles = None
+    if source_name in URINE_FILES and 'Диагноз' in display_columns:
+        diagnosis_styles = DIAGNOSIS_CARD_STYLES[bool(positive_diagnosis)]
+
+    cards = []
+    for column, display_value in zip(display_columns, formatted_row):
+        if diagnosis_styles is not None and column == 'Диагноз':
+            card_style, value_style = diagnosis_styles
+        else:
+            card_style, value_style = PLAIN_CARD_STYLES
+        cards.append(
+            html.Button(
+                html.Div([
+                    html.H5(column.replace('_', ' '), style=CARD_TITLE_STYLE),
+                    html.P(display_value, style=value_style)
+                ], style=card_style),
+                id={'type': 'metric-card', 'metric': column},
+                n_clicks=0,
+                style=CARD_BUTTON_STYLE
             )
+        )
+
+    body = []
+    if source_name in BLOOD_FILES:
+        body.append(build_metric_gauge_block(
+            gauge_values['Гемоглобин'], row_identifier, 'Гемоглобин', build_hemoglobin_gauge, source_name
+        ))
+        body.append(build_metric_gauge_block(
+            gauge_values['Тромбоциты'], row_identifier, 'Тромбоциты', build_platelet_gauge, source_name
+        ))
+    body.append(html.Div(cards, style=CARDS_ROW_STYLE))
+    return body
+
+
+def build_patient_result_sections(source_groups):
+    """Собирает карточки показателей для всех таблиц выбранного пациента.
 
+    `source_groups` — пары (Source_File, строки) одного пациента, уже
+    отсортированные по дате (см. `group_patient_sources`), чтобы врач видел
+    первичный источник. Для каждого источника выводим имя/пол пациента и
+    свёрнутый список исследований; карточки и индикаторы (гемоглобин,
+    тромбоциты) с историческими графиками строятся коллбеком при первом
+    раскрытии (см. `build_result_row_body`), а до того в строке лежит заглушка.
+    """
+    if not source_groups:
+        return html.P('Нет данных по выбранному пациенту.', style={'color': '#555555'})
+
+    sections = []
+    for source_name, subset in source_groups:
+        rows = []
+        header_name = subset['Имя'].iat[0] if 'Имя' in subset.columns else 'Имя неизвестно'
+        header_gender = subset['Пол'].iat[0] if 'Пол' in subset.columns else 'Пол неизвестен'
+        for row_idx, date_value in enumerate(_summary_dates(subset)):
             rows.append(
                 html.Details(
-                    open=True,
-                    style={'marginBottom': '12px', 'border': '1px solid #e0e0e0', 'borderRadius': '8px', 'padding': '10px'},
-                    children=detail_children
+                    id={'type': 'details-toggle', 'source': source_name, 'row': row_idx},
+                    open=False,
+                    n_clicks=0,
+                    style=DETAILS_STYLE,
+                    children=[
+                        html.Summary(f"{source_name} — {date_value}", style=DETAILS_SUMMARY_STYLE),
+                        html.Div(
+                            DETAILS_PLACEHOLDER,
+                            id={'type': 'details-body', 'source': source_name, 'row': row_idx}
+                        )
+                    ]
                 )
             )
 
         display_name = SOURCE_LABELS.get(source_name, source_name)
         sections.append(
             html.Div(
-                style={
-                    'padding': '20px',
-                    'border': '1px solid #e0e0e0',
-                    'borderRadius': '12px',
-                    'backgroundColor': 'white',
-                    'boxShadow': '2px 2px 8px rgba(0,0,0,0.1)'
-                },
+                style=SOURCE_SECTION_STYLE,
                 children=[
-                    html.H4(
-                        f"Источник: {display_name}",
-                        style={'color': '#1f77b4', 'marginBottom': '5px'}
-                    ),
-                    html.P(
-                        f"{header_name} — {header_gender}",
-                        style={'color': '#555555', 'marginBottom': '15px', 'fontSize': '18px', 'fontWeight': '500'}
-                    ),
-                    html.Div(rows, style={'display': 'flex', 'flexDirection': 'column', 'gap': '10px'})
+                    html.H4(f"Источник: {display_name}", style=SOURCE_TITLE_STYLE),
+                    html.P(f"{header_name} — {header_gender}", style=SOURCE_PATIENT_STYLE),
+                    html.Div(rows, style=SOURCE_ROWS_STYLE)
                 ]
             )
         )
@@ -309,11 +544,88 @@ def build_patient_result_sections(patient_df: pd.DataFrame, source_column_map):
     )
 
 
-def build_dashboard_container(patient_options, global_scatter_fig):
+def _unavailable_box_plot(title, header):
+    fig = px.box(template='plotly_white')
+    fig.update_layout(title=title)
+    return {'figure': serialize_figure(fig), 'header': header}
+
+
+def build_gender_box_plot(gender_groups, selected_parameter):
+    """Box-plot показателя по полу из заранее посчитанных статистик."""
+    label = selected_parameter.replace('_', ' ')
+    traces = []
+    for gender, columns in gender_groups.items():
+        stats = summarize_box(columns[selected_parameter])
+        if stats is None:
+            continue
+        traces.append(
+            go.Box(
+                x=[str(gender)],
+                y=[stats['outliers']],
+                name=str(gender),
+                q1=[stats['q1']],
+                median=[stats['median']],
+                q3=[stats['q3']],
+                lowerfence=[stats['lowerfence']],
+                upperfence=[stats['upperfence']],
+                notchspan=[stats['notchspan']],
+                notched=True,
+                boxpoints='outliers'
+            )
+        )
+    fig = go.Figure(data=traces)
+    fig.update_layout(
+        template='plotly_white',
+        title=f'Distribution of {label} by Пол',
+        xaxis_title='Пол',
+        yaxis_title=label,
+        margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        showlegend=False
+    )
+    return {'figure': serialize_figure(fig), 'header': f"Boxplot: {label}"}
+
+
+def build_box_plot_payload(blood_df: pd.DataFrame):
+    """Готовит box-plot для всех числовых показателей `blood_df` разом.
+
+    blood_df не меняется за время жизни приложения, поэтому фигуры
+    строятся один раз при старте и отдаются браузеру одним JSON
+    (см. BOX_PLOTS_URL); `fallback` показывается для неизвестного показателя.
+    """
+    fallback = _unavailable_box_plot(
+        'Параметр недоступен в текущем наборе данных',
+        'Выберите показатель, кликая по карточкам пациента — boxplot'
+    )
+    box_parameters = blood_df.select_dtypes('number').columns.tolist()
+    if 'Пол' not in blood_df.columns:
+        missing_gender = _unavailable_box_plot(
+            'Пол (Пол) отсутствует в наборе данных',
+            'Boxplot недоступен: нет колонки Пол'
+        )
+        return {'figures': {str(column): missing_gender for column in box_parameters}, 'fallback': fallback}
+
+    # Разбиение blood_df по полу делается один раз: box-plot получает готовые
+    # массивы вместо того, чтобы Plotly Express каждый раз сканировал таблицу.
+    gender_groups = {
+        gender: {column: subset[column].to_numpy() for column in box_parameters}
+        for gender, subset in blood_df.groupby('Пол', sort=False, observed=True)
+    }
+    with ThreadPoolExecutor() as executor:
+        figures = list(executor.map(lambda column: build_gender_box_plot(gender_groups, column), box_parameters))
+    return {'figures': dict(zip(map(str, box_parameters), figures)), 'fallback': fallback}
+
+
+def build_dashboard_container(patient_options):
     return html.Div(
         id='dashboard-container',
         style={'display': 'none'},
         children=[
+            # Опции лежат в Store и попадают в список клиентским коллбеком,
+            # без серверного round-trip и повторной сериализации. Scatter
+            # браузер загружает отдельно (см. SCATTER_FIGURE_URL).
+            dcc.Store(id='patient-options-store', data=patient_options),
             html.Div(
                 style={
                     'marginBottom': '20px',
@@ -334,7 +646,7 @@ def build_dashboard_container(patient_options, global_scatter_fig):
                             html.H2('Выберите пациента', style={'color': '#1f77b4'}),
                             dcc.Dropdown(
                                 id='patient-dropdown',
-                                options=patient_options,
+                                options=[],
                                 placeholder='Выберите уникальную комбинацию возраста и пола',
                                 value=None,
                                 style={'marginTop': '10px'}
@@ -384,7 +696,7 @@ def build_dashboard_container(patient_options, global_scatter_fig):
                         style={'padding': '20px', 'backgroundColor': 'white', 'borderRadius': '8px', 'boxShadow': '2px 2px 10px #aaaaaa'},
                         children=[
                             html.H3('Эритроциты vs. Гемоглобин by Возраст and Пол', style={'textAlign': 'center', 'color': '#2ca02c'}),
-                            dcc.Graph(id='rbc-hgb-scatter', figure=global_scatter_fig, style={'height': '500px'})
+                            dcc.Graph(id='rbc-hgb-scatter', style={'height': '500px'})
                         ]
                     )
                 ]
@@ -394,128 +706,226 @@ def build_dashboard_container(patient_options, global_scatter_fig):
 
 
 def register_dashboard_callbacks(app, df, source_column_map, blood_df):
+    app.clientside_callback(
+        'function(options) { return options || []; }',
+        Output('patient-dropdown', 'options'),
+        Input('patient-options-store', 'data')
+    )
+    # Общий scatter не входит в layout: после входа браузер один раз
+    # скачивает готовый JSON и дальше берёт его из HTTP-кэша.
+    app.clientside_callback(
+        '''
+        function(style, figure) {
+            if (!style || style.display === 'none' || (figure && figure.data && figure.data.length)) {
+                return dash_clientside.no_update;
+            }
+            return fetch('%s').then(function(response) { return response.json(); });
+        }
+        ''' % SCATTER_FIGURE_URL,
+        Output('rbc-hgb-scatter', 'figure'),
+        Input('dashboard-container', 'style'),
+        State('rbc-hgb-scatter', 'figure')
+    )
+
+    # Группировка по (Patient_Key, Source_File) строится один раз: выбор
+    # пациента в выпадающем списке превращается в поиск по словарю вместо
+    # полного сканирования `df` булевой маской.
+    source_index = group_patient_sources(df)
+    display_column_map = build_display_column_map(source_column_map, df.columns)
+    formatted_df = format_frame(df)
+
+    # Дерево карточек детерминировано для пациента: повторный выбор того же
+    # ID не должен заново группировать строки и собирать компоненты.
+    @lru_cache(maxsize=512)
+    def _sections_for(patient_key):
+        return build_patient_result_sections(source_index[patient_key].items())
+
+    # Всё, что нужно для строк одного источника, извлекается одним разом:
+    # матрица готовых строк карточек, колонки индикаторов и маска диагнозов.
+    # Тело строки дальше собирается обычной индексацией массивов.
+    @lru_cache(maxsize=512)
+    def _source_arrays_for(patient_key, source_name):
+        subset = source_index[patient_key][source_name]
+        display_columns = _display_columns_for(source_name, subset, display_column_map)
+        formatted_rows = formatted_df.loc[subset.index, display_columns].to_numpy()
+        positive_mask = positive_diagnosis_mask(subset) if source_name in URINE_FILES else None
+        return display_columns, formatted_rows, gauge_arrays(subset), positive_mask
+
+    @lru_cache(maxsize=2048)
+    def _row_body_for(patient_key, source_name, row_idx):
+        display_columns, formatted_rows, arrays, positive_mask = _source_arrays_for(patient_key, source_name)
+        gauge_values = {metric: gauge_values_at(arrays, metric, row_idx) for metric in REFERENCE_COLUMNS}
+        return build_result_row_body(
+            formatted_rows[row_idx], display_columns, source_name, f"{source_name}-{row_idx}", gauge_values,
+            positive_diagnosis=positive_mask is not None and positive_mask[row_idx]
+        )
+
+    @app.callback(
+        Output({'type': 'details-body', 'source': MATCH, 'row': MATCH}, 'children'),
+        Input({'type': 'details-toggle', 'source': MATCH, 'row': MATCH}, 'n_clicks'),
+        State({'type': 'details-body', 'source': MATCH, 'row': MATCH}, 'children'),
+        State('patient-dropdown', 'value'),
+        State({'type': 'details-toggle', 'source': MATCH, 'row': MATCH}, 'id'),
+        prevent_initial_call=True
+    )
+    def render_details_body(n_clicks, body, patient_key, details_id):
+        # Клики внутри уже раскрытого исследования (карточки, индикаторы)
+        # тоже увеличивают n_clicks — содержимое строится только один раз.
+        if not n_clicks or body != DETAILS_PLACEHOLDER or patient_key is None:
+            return no_update
+        if details_id['source'] not in source_index.get(patient_key, {}):
+            return no_update
+        return _row_body_for(patient_key, details_id['source'], details_id['row'])
+
     @app.callback(
-        Output('patient-data-store', 'data'),
         Output('patient-results', 'children'),
         Output('visual-section', 'style'),
         Input('patient-dropdown', 'value')
     )
     def handle_patient_selection(patient_key):
         if not patient_key:
-            return [], html.Div(), {'display': 'none'}
+            return html.Div(), {'display': 'none'}
 
-        patient_df = df[df['Patient_Key'] == patient_key]
-        if patient_df.empty:
-            return [], html.P('Нет данных по выбранному пациенту.', style={'color': '#555555'}), {'display': 'none'}
+        if patient_key not in source_index:
+            return html.P('Нет данных по выбранному пациенту.', style={'color': '#555555'}), {'display': 'none'}
 
-        result_sections = build_patient_result_sections(patient_df, source_column_map)
-        return patient_df.to_dict('records'), result_sections, {'display': 'block'}
+        # Строки пациента лежат на сервере в `source_index`; зависимые
+        # коллбеки читают ключ прямо из значения выпадающего списка.
+        return _sections_for(patient_key), {'display': 'block'}
 
-    def _build_metric_history(records, source_name, metric_key):
+    # История показателя зависит только от (пациент, источник, показатель):
+    # повторные клики «показать/скрыть» отдают уже сериализованную фигуру.
+    @lru_cache(maxsize=1024)
+    def _build_metric_history(patient_key, source_name, metric_key):
         fig = empty_gauge_figure(metric_key)
-        if not records:
+        if patient_key is None:
             return fig
-        df_local = pd.DataFrame(records)
-        if 'Source_File' not in df_local.columns:
+        subset = source_index.get(patient_key, {}).get(source_name)
+        if subset is None or subset.empty or metric_key not in subset.columns:
             return fig
-        df_local = df_local[df_local['Source_File'] == source_name]
-        if df_local.empty or metric_key not in df_local.columns:
-            return fig
-        date_col = 'Дата' if 'Дата' in df_local.columns else ('Date' if 'Date' in df_local.columns else None)
+        date_col = _date_column(subset.columns)
         if date_col is None:
             return fig
-        df_local = df_local.dropna(subset=[metric_key])
-        if df_local.empty:
+
+        # Хронологический порядок — стабильная сортировка индексов строк с
+        # датой (пропуски в конце, как в sort_values). Фигура собирается
+        # dict-ом прямо из массивов, без копии DataFrame.
+        dates = subset[date_col].to_numpy()
+        missing_date = pd.isna(dates)
+        dated = np.flatnonzero(~missing_date)
+        order = np.concatenate([dated[np.argsort(dates[dated], kind='stable')], np.flatnonzero(missing_date)])
+        values = subset[metric_key].to_numpy()[order]
+        has_value = ~pd.isna(values)
+        if not has_value.any():
             return fig
-        df_local = df_local.sort_values(by=date_col)
-        fig_obj = px.line(df_local, x=date_col, y=metric_key, markers=True, template='plotly_white')
-        fig_obj.update_layout(title=f'{metric_key} во времени')
-
-        ref_cols = REFERENCE_COLUMNS.get(metric_key)
-        if ref_cols:
-            min_col, max_col = ref_cols
-            if min_col in df_local.columns and not df_local[min_col].dropna().empty:
-                fig_obj.add_scatter(
-                    x=df_local[date_col],
-                    y=df_local[min_col],
-                    mode='lines',
-                    name=f'{metric_key} мин норма',
-                    line={'color': '#d62728', 'dash': 'dot'}
-                )
-            if max_col in df_local.columns and not df_local[max_col].dropna().empty:
-                fig_obj.add_scatter(
-                    x=df_local[date_col],
-                    y=df_local[max_col],
-                    mode='lines',
-                    name=f'{metric_key} макс норма',
-                    line={'color': '#d62728', 'dash': 'dash'}
-                )
-        return fig_obj
+        order = order[has_value]
+        x = _json_values(dates[order])
+
+        traces = [{
+            'type': 'scatter',
+            'x': x,
+            'y': _json_values(values[has_value]),
+            'mode': 'lines+markers',
+            'showlegend': False,
+            'hovertemplate': f'{date_col}=%{{x}}<br>{metric_key}=%{{y}}<extra></extra>'
+        }]
+        bounds = zip(REFERENCE_COLUMNS.get(metric_key, ()), ('мин норма', 'макс норма'), ('dot', 'dash'))
+        for bound_col, label, dash in bounds:
+            if bound_col not in subset.columns:
+                continue
+            bound_values = subset[bound_col].to_numpy()[order]
+            if pd.isna(bound_values).all():
+                continue
+            traces.append({
+                'type': 'scatter',
+                'x': x,
+                'y': _json_values(bound_values),
+                'mode': 'lines',
+                'name': f'{metric_key} {label}',
+                'line': {'color': '#d62728', 'dash': dash}
+            })
+
+        return {
+            'data': traces,
+            'layout': {
+                'template': HISTORY_TEMPLATE,
+                'title': {'text': f'{metric_key} во времени'},
+                'xaxis': {'title': {'text': date_col}},
+                'yaxis': {'title': {'text': metric_key}}
+            }
+        }
 
     @app.callback(
         Output({'type': 'gauge-plot', 'row': MATCH, 'metric': MATCH, 'source': MATCH}, 'figure'),
         Output({'type': 'gauge-plot', 'row': MATCH, 'metric': MATCH, 'source': MATCH}, 'style'),
         Input({'type': 'gauge-toggle', 'row': MATCH, 'metric': MATCH, 'source': MATCH}, 'n_clicks'),
-        State('patient-data-store', 'data'),
+        State('patient-dropdown', 'value'),
         State({'type': 'gauge-toggle', 'row': MATCH, 'metric': MATCH, 'source': MATCH}, 'id'),
         prevent_initial_call=True
     )
-    def toggle_gauge_plot(n_clicks, records, button_id):
+    def toggle_gauge_plot(n_clicks, patient_key, button_id):
         shown = {'display': 'block', 'height': 220, 'width': '50%', 'margin': '10px auto 0'}
         hidden = {'display': 'none', 'height': 220, 'width': '50%', 'margin': '10px auto 0'}
-        fig = _build_metric_history(records, button_id['source'], button_id['metric'])
-        if n_clicks and n_clicks % 2 == 1:
-            return fig, shown
-        return fig, hidden
-
-    @app.callback(
+        # При скрытии график остаётся прежним: фигуру не строим и не отправляем.
+        if not (n_clicks and n_clicks % 2 == 1):
+            return no_update, hidden
+        return _build_metric_history(patient_key, button_id['source'], button_id['metric']), shown
+
+    # Клик по карточке разрешается в браузере: список допустимых показателей
+    # встраивается в JS один раз, и серверный round-trip не нужен.
+    app.clientside_callback(
+        '''
+        function(clicks, currentMetric) {
+            const validMetrics = %s;
+            const triggered = dash_clientside.callback_context.triggered_id;
+            if (!triggered) {
+                return dash_clientside.no_update;
+            }
+            const metric = typeof triggered === 'object' ? triggered.metric : null;
+            if (metric && validMetrics.includes(metric)) {
+                return metric;
+            }
+            return currentMetric;
+        }
+        ''' % json.dumps([str(column) for column in blood_df.columns], ensure_ascii=False),
         Output('selected-metric', 'data'),
         Input({'type': 'metric-card', 'metric': ALL}, 'n_clicks'),
         State('selected-metric', 'data'),
         prevent_initial_call=True
     )
-    def set_selected_metric(clicks, current_metric):
-        if not ctx.triggered_id:
-            return no_update
-        metric = ctx.triggered_id.get('metric') if isinstance(ctx.triggered_id, dict) else None
-        if metric and metric in blood_df.columns:
-            return metric
-        return current_metric
 
-    @app.callback(
+    # Box-plot по каждому показателю заранее посчитаны на сервере
+    # (`build_box_plot_payload`). Браузер скачивает и разбирает их один раз
+    # за сессию (промис хранится в `window`), после чего выбор показателя
+    # только переключает готовую фигуру, без запросов к серверу.
+    app.clientside_callback(
+        '''
+        function(metric, currentHeader) {
+            if (!window.meditronBoxPlots) {
+                window.meditronBoxPlots = fetch('%s').then(function(response) {
+                    if (!response.ok) {
+                        throw new Error('box plots: HTTP ' + response.status);
+                    }
+                    return response.json();
+                }).catch(function(error) {
+                    window.meditronBoxPlots = null;
+                    throw error;
+                });
+            }
+            return window.meditronBoxPlots.then(function(plots) {
+                const known = metric && Object.prototype.hasOwnProperty.call(plots.figures, metric);
+                const entry = known ? plots.figures[metric] : plots.fallback;
+                if (entry.header === currentHeader) {
+                    return [dash_clientside.no_update, dash_clientside.no_update];
+                }
+                return [entry.figure, entry.header];
+            });
+        }
+        ''' % BOX_PLOTS_URL,
         Output('gender-box-plot', 'figure'),
         Output('boxplot-title', 'children'),
-        Input('selected-metric', 'data')
+        Input('selected-metric', 'data'),
+        State('boxplot-title', 'children')
     )
-    def update_box_plot(selected_parameter):
-        if not selected_parameter or selected_parameter not in blood_df.columns:
-            fig = px.box(template='plotly_white')
-            fig.update_layout(title='Параметр недоступен в текущем наборе данных')
-            return fig, 'Выберите показатель, кликая по карточкам пациента — boxplot'
-
-        if 'Пол' not in blood_df.columns:
-            fig = px.box(template='plotly_white')
-            fig.update_layout(title='Пол (Пол) отсутствует в наборе данных')
-            return fig, 'Boxplot недоступен: нет колонки Пол'
-
-        fig = px.box(
-            blood_df,
-            x='Пол',
-            y=selected_parameter,
-            color='Пол',
-            notched=True,
-            points='suspectedoutliers',
-            title=f'Distribution of {selected_parameter.replace("_", " ")} by Пол',
-            labels={selected_parameter: selected_parameter.replace("_", " ")},
-            template='plotly_white'
-        )
-        fig.update_layout(
-            margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
-            plot_bgcolor='white',
-            paper_bgcolor='white',
-            showlegend=False
-        )
-        header = f"Boxplot: {selected_parameter.replace('_', ' ')}"
-        return fig, header
 
     return app
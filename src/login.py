@@ -1,4 +1,4 @@
-from dash import dcc, html, Input, Output, State, no_update
+from dash import dcc, html, Input, Output, State
 
 
 def build_login_section():
@@ -89,7 +89,17 @@ def register_login_callbacks(app):
     UI скрывает форму и отображает основное приложение. Коллбек logout
     возвращает пользователя на экран входа, очищая чувствительные данные.
     """
-    @app.callback(
+    # Вход, выход и переключение экранов только меняют Store и стили, поэтому
+    # выполняются в браузере без запроса к серверу.
+    app.clientside_callback(
+        '''
+        function(nClicks, username, password) {
+            if (!username || !password) {
+                return [dash_clientside.no_update, 'Введите логин и пароль.'];
+            }
+            return [{authorized: true, username: username}, ''];
+        }
+        ''',
         Output('auth-store', 'data'),
         Output('login-feedback', 'children'),
         Input('login-button', 'n_clicks'),
@@ -97,37 +107,34 @@ def register_login_callbacks(app):
         State('password-input', 'value'),
         prevent_initial_call=True
     )
-    def handle_login(n_clicks, username, password):
-        if not username or not password:
-            return no_update, 'Введите логин и пароль.'
-
-        return {'authorized': True, 'username': username}, ''
 
-    @app.callback(
+    app.clientside_callback(
+        '''
+        function(authData) {
+            const isAuthorized = Boolean(authData && authData.authorized);
+            const loginStyle = {
+                alignItems: 'center',
+                justifyContent: 'center',
+                minHeight: '80vh',
+                display: isAuthorized ? 'none' : 'flex'
+            };
+            return [loginStyle, {display: isAuthorized ? 'block' : 'none'}];
+        }
+        ''',
         Output('login-container', 'style'),
         Output('dashboard-container', 'style'),
         Input('auth-store', 'data')
     )
-    def toggle_pages(auth_data):
-        is_authorized = auth_data.get('authorized') if isinstance(auth_data, dict) else False
 
-        login_style = {
-            'alignItems': 'center',
-            'justifyContent': 'center',
-            'minHeight': '80vh',
-            'display': 'none' if is_authorized else 'flex'
+    app.clientside_callback(
+        '''
+        function(nClicks) {
+            return nClicks ? {authorized: false} : dash_clientside.no_update;
         }
-        dashboard_style = {'display': 'block' if is_authorized else 'none'}
-        return login_style, dashboard_style
-
-    @app.callback(
+        ''',
         Output('auth-store', 'data', allow_duplicate=True),
         Input('logout-button', 'n_clicks'),
         prevent_initial_call=True
     )
-    def handle_logout(n_clicks):
-        if n_clicks:
-            return {'authorized': False}
-        return no_update
 
     return app
@@ -1,13 +1,49 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 from dash import Dash, dcc, html
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него остаётся стандартный json
+    orjson = None
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:  # без pyarrow CSV читается стандартным C-парсером pandas
+    CSV_ENGINE = 'c'
+else:
+    CSV_ENGINE = 'pyarrow'
+
+try:
+    import flask_compress  # noqa: F401
+except ImportError:  # без flask-compress ответы уходят несжатыми
+    COMPRESS_RESPONSES = False
+else:
+    COMPRESS_RESPONSES = True
+
+try:
+    from tsdownsample import LTTBDownsampler
+except ImportError:  # без tsdownsample работает numpy-реализация `lttb_indices`
+    LTTBDownsampler = None
 
 from .login import build_login_section, register_login_callbacks
 from .dashboard import (
+    BOX_PLOTS_URL,
+    GAUGE_COLUMNS,
+    SCATTER_FIGURE_URL,
+    build_box_plot_payload,
     build_patient_options,
     build_dashboard_container,
+    serialize_figure,
     register_dashboard_callbacks
 )
 
@@ -19,8 +55,49 @@ numerical_cols = [
     'Эритроциты', 'СОЭ', 'Среднее содержание эритроцита', 'Средняя концентрация гемоглобина'
 ]
 
+# Выше этого числа точек scatter прореживается: браузеру не нужно рисовать
+# десятки тысяч маркеров, чтобы показать форму облака.
+SCATTER_POINT_LIMIT = 5000
+SCATTER_POINTS_PER_GROUP = 2000
+SCATTER_REQUIRED_COLUMNS = frozenset({'Эритроциты', 'Гемоглобин', 'Пол', 'Возраст'})
+SCATTER_HOVER_COLUMNS = ('Тромбоциты', 'Лейкоциты')
+
 DATA_DIR = Path('data')
 SOURCE_COLUMN_MAP = {}
+# pyarrow распознаёт ISO-даты как datetime.date; дата должна остаться строкой,
+# как при чтении C-парсером.
+TEXT_COLUMNS = ('Дата', 'Date')
+# Версия разбора входит в имя Parquet-кэша: после изменения парсера
+# (TEXT_COLUMNS, движок, выбор разделителя в `read_tabular_file`) кэш
+# пересобирается, даже если исходный файл не менялся. При правках разбора,
+# которые не видны в сигнатуре, версию нужно увеличить.
+PARQUET_CACHE_VERSION = 1
+# Layout (со списком пациентов в dcc.Store; scatter скачивается отдельно по
+# SCATTER_FIGURE_URL) и список коллбеков одинаковы для всех сессий, поэтому
+# браузер может переиспользовать их между визитами — но только после
+# проверки ETag: после деплоя старый граф коллбеков не должен жить в кэше,
+# а список пациентов — попадать в общие прокси.
+CACHEABLE_DASH_ROUTES = ('/_dash-layout', '/_dash-dependencies')
+DASH_ROUTES_CACHE_CONTROL = 'private, no-cache'
+
+
+def read_csv_arrow(file_path: Path, sep: str) -> pd.DataFrame:
+    """Parse a CSV with pyarrow directly, without pandas' engine wrapper.
+
+    Типы известных текстовых колонок задаются явно, остальные выводит
+    Arrow; пустые строки, как и в pandas, считаются пропусками. Результат
+    переводится в обычные numpy-колонки, с которыми работают индикаторы
+    и графики.
+    """
+    table = pa_csv.read_csv(
+        file_path,
+        parse_options=pa_csv.ParseOptions(delimiter=sep),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in TEXT_COLUMNS},
+            strings_can_be_null=True
+        )
+    )
+    return table.to_pandas()
 
 
 def read_tabular_file(file_path: Path) -> pd.DataFrame:
@@ -30,41 +107,281 @@ def read_tabular_file(file_path: Path) -> pd.DataFrame:
     медицинские значения «слипаются» в один столбец. Функция гарантирует,
     что дальнейшие алгоритмы (индикаторы, графики) получают корректный
     числовой DataFrame.
+
+    Если установлен pyarrow, CSV разбирается его многопоточным парсером;
+    при ошибке разбора используется стандартный движок pandas.
     """
     if file_path.suffix.lower() == '.xlsx':
         return pd.read_excel(file_path)
     sep = ';' if 'анализ_крови' in file_path.name else ','
+    if CSV_ENGINE == 'pyarrow':
+        try:
+            return read_csv_arrow(file_path, sep)
+        except (ValueError, pa.ArrowException):
+            pass
     return pd.read_csv(file_path, sep=sep)
 
 
+def parquet_cache_path(file_path: Path) -> Path:
+    """`<файл>.<сигнатура парсера>.parquet` рядом с исходником."""
+    parser_signature = repr((PARQUET_CACHE_VERSION, CSV_ENGINE, TEXT_COLUMNS)).encode('utf-8')
+    digest = hashlib.sha1(parser_signature).hexdigest()[:8]
+    return file_path.with_suffix(f'{file_path.suffix}.{digest}.parquet')
+
+
+def cached_read(file_path: Path) -> pd.DataFrame:
+    """Read a data file through a Parquet cache stored next to it.
+
+    Разбор CSV и особенно XLSX повторяется при каждом запуске, хотя
+    выгрузки меняются редко. Если рядом лежит кэш текущей версии парсера
+    (`parquet_cache_path`) не старше исходника, читается он; иначе файл
+    разбирается заново, кэш перезаписывается, а кэши прежних версий
+    удаляются. Без pyarrow кэш не используется, а ошибка записи
+    (например, каталог только для чтения) не мешает загрузке.
+    """
+    if CSV_ENGINE != 'pyarrow':
+        return read_tabular_file(file_path)
+    cache_path = parquet_cache_path(file_path)
+    if cache_path.exists() and cache_path.stat().st_mtime >= file_path.stat().st_mtime:
+        try:
+            return pd.read_parquet(cache_path, engine='pyarrow')
+        except Exception:
+            pass
+    df_local = read_tabular_file(file_path)
+    try:
+        df_local.to_parquet(cache_path, engine='pyarrow', compression='zstd', index=False)
+        for stale_cache in file_path.parent.glob(f'{file_path.name}.*parquet'):
+            if stale_cache != cache_path:
+                stale_cache.unlink(missing_ok=True)
+    except Exception:
+        cache_path.unlink(missing_ok=True)
+    return df_local
+
+
+@lru_cache(maxsize=32)
+def _parse_file(file_path: Path, mtime: float) -> pd.DataFrame:
+    return cached_read(file_path)
+
+
+def read_data_file(file_path: Path) -> pd.DataFrame:
+    """Read a data file once per modification time.
+
+    `анализ_крови` читается и в общую таблицу, и в `blood_df`; повторный
+    вызов для неизменённого файла возвращает уже разобранный DataFrame.
+    Результат общий для всех вызовов, поэтому изменять его на месте нельзя.
+    """
+    return _parse_file(file_path, file_path.stat().st_mtime)
+
+
+def _read_or_skip(file_path: Path):
+    try:
+        return read_data_file(file_path)
+    except Exception:
+        return None
+
+
 def load_all_datasets(data_dir: Path):
     """Aggregate все таблицы из каталога `data/`.
 
-    - Читает каждый CSV/XLSX.
-    - Добавляет `Source_File`, чтобы UI мог показать первичный источник.
+    - Читает каждый CSV/XLSX параллельно в пуле потоков (разбор файлов
+      в pandas/pyarrow отпускает GIL); нечитаемые файлы пропускаются.
+    - Добавляет `Source_File`, чтобы UI мог показать первичный источник;
+      колонка собирается один раз после склейки как категория.
     - Нормализует имя столбца (Gender → Пол и т.п.) через `normalize_columns`.
 
-    Возвращает объединённый DataFrame и карту колонок для каждого файла.
+    Возвращает объединённый DataFrame и карту колонок (кортежей) для
+    каждого файла.
     """
-    frames = []
-    column_map = {}
+    files = []
     if data_dir.exists():
         for pattern in ('*.csv', '*.xlsx'):
-            for file_path in sorted(data_dir.glob(pattern)):
-                try:
-                    df_local = read_tabular_file(file_path)
-                except Exception:
-                    continue
+            files.extend(sorted(data_dir.glob(pattern)))
 
-                column_map[file_path.name] = df_local.columns.tolist()
-                df_local['Source_File'] = file_path.name
-                frames.append(df_local)
+    frames = []
+    names = []
+    column_map = {}
+    # Файлы с одинаковой схемой ссылаются на один и тот же кортеж колонок.
+    schemas = {}
+    if files:
+        with ThreadPoolExecutor(max_workers=min(8, len(files))) as executor:
+            loaded = list(executor.map(_read_or_skip, files))
+
+        for file_path, df_local in zip(files, loaded):
+            if df_local is None:
+                continue
+            schema = tuple(df_local.columns)
+            column_map[file_path.name] = schemas.setdefault(schema, schema)
+            names.append(file_path.name)
+            frames.append(df_local)
 
     if not frames:
         raise FileNotFoundError("No CSV files found inside the 'data' directory.")
 
-    combined = pd.concat(frames, ignore_index=True)
-    return combined.reset_index(drop=True), column_map
+    combined = concat_frames(frames)
+    # Категории упорядочены по имени файла, а не по порядку загрузки
+    # (сначала *.csv, потом *.xlsx): groupby по категории выдаёт источники
+    # пациента в алфавитном порядке.
+    categories = sorted(names)
+    ranks = np.array([categories.index(name) for name in names], dtype=np.int32)
+    codes = np.repeat(ranks, [len(frame) for frame in frames])
+    combined['Source_File'] = pd.Categorical.from_codes(codes, categories=categories)
+    return combined, column_map
+
+
+def _combined_dtype(dtypes, complete):
+    if len(set(dtypes)) == 1 and complete:
+        return dtypes[0]
+    if all(dtype.kind in 'iuf' for dtype in dtypes):
+        dtype = np.result_type(*dtypes)
+        return dtype if complete or dtype.kind == 'f' else np.dtype('float64')
+    return np.dtype(object)
+
+
+def concat_frames(frames) -> pd.DataFrame:
+    """Склеивает таблицы с разным набором колонок за один проход.
+
+    Буфер каждой колонки выделяется сразу на все строки, и значения
+    каждого файла копируются в свой срез; пропущенные колонки остаются NaN.
+    Результат совпадает с `pd.concat(frames, ignore_index=True)`; таблицы
+    с extension-типами склеиваются самим pandas.
+    """
+    if any(not isinstance(dtype, np.dtype) for frame in frames for dtype in frame.dtypes):
+        return pd.concat(frames, ignore_index=True)
+
+    total_rows = sum(len(frame) for frame in frames)
+    columns = list(dict.fromkeys(column for frame in frames for column in frame.columns))
+    data = {}
+    for column in columns:
+        dtypes = [frame[column].dtype for frame in frames if column in frame.columns]
+        dtype = _combined_dtype(dtypes, len(dtypes) == len(frames))
+        if dtype.kind in 'fO':
+            buffer = np.full(total_rows, np.nan, dtype=dtype)
+        else:
+            buffer = np.empty(total_rows, dtype=dtype)
+        start = 0
+        for frame in frames:
+            if column in frame.columns:
+                buffer[start:start + len(frame)] = frame[column].to_numpy(dtype=dtype)
+            start += len(frame)
+        data[column] = buffer
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def coerce_numeric_columns(df_source: pd.DataFrame, columns) -> pd.DataFrame:
+    """Convert text measurements (`12,4`) to floats once after loading.
+
+    Индикаторы норм читают эти колонки для каждой строки анализа; если
+    значения уже числовые, разбирать строки при каждой отрисовке не нужно.
+    Нераспознанные значения становятся NaN.
+    """
+    for column in columns:
+        if column in df_source.columns and not pd.api.types.is_numeric_dtype(df_source[column]):
+            df_source[column] = pd.to_numeric(
+                df_source[column].astype(str).str.replace(',', '.', regex=False),
+                errors='coerce'
+            )
+    return df_source
+
+
+def ensure_contiguous_columns(df_source: pd.DataFrame, columns) -> pd.DataFrame:
+    """Keep numeric columns backed by C-contiguous arrays.
+
+    Индикаторы и box-plot читают эти колонки целиком через `to_numpy()`;
+    после некоторых операций pandas колонка может оказаться видом с шагом
+    (strided view), и тогда каждая выборка копирует данные. Такие колонки
+    один раз пересобираются в непрерывный буфер.
+    """
+    for column in columns:
+        if column in df_source.columns and pd.api.types.is_numeric_dtype(df_source[column]):
+            values = df_source[column].to_numpy()
+            if not values.flags['C_CONTIGUOUS']:
+                df_source[column] = np.ascontiguousarray(values)
+    return df_source
+
+
+def compact_blood_frame(df_source: pd.DataFrame) -> pd.DataFrame:
+    """Shrink `blood_df` dtypes for the global графики.
+
+    `Пол` хранится как категория: box-plot и scatter группируют по нему
+    коды, а не строки. Числовые колонки остаются float64 — во float32
+    значения вроде 4.7 превращаются в 4.699999809265137 в подсказках и
+    статистиках box-plot.
+    """
+    if 'Пол' in df_source.columns:
+        df_source['Пол'] = df_source['Пол'].astype('category')
+    return df_source
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider on top of orjson.
+
+    Plotly (а через него и ответы Dash-коллбеков) сам выбирает orjson,
+    если тот установлен; провайдер переводит на него и остальные
+    Flask-ответы (`_dash-dependencies`) и разбор тел запросов коллбеков.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """Pick `n_out` representative points with Largest-Triangle-Three-Buckets.
+
+    Точки упорядочиваются по x и делятся на корзины; из каждой берётся
+    точка, образующая наибольший треугольник с предыдущей выбранной и
+    средним следующей корзины, поэтому экстремумы облака сохраняются.
+    Возвращает позиции выбранных точек в исходных массивах.
+
+    Если установлен tsdownsample, выбор делает его компилированный LTTB.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    order = np.argsort(x, kind='stable')
+    xs, ys = x[order], y[order]
+    if LTTBDownsampler is not None:
+        return order[LTTBDownsampler().downsample(xs, ys, n_out=n_out)]
+
+    bins = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    selected = [0]
+    anchor = 0
+    for i in range(n_out - 2):
+        start, end = bins[i], bins[i + 1]
+        next_start, next_end = (bins[i + 1], bins[i + 2]) if i + 2 < len(bins) else (n - 1, n)
+        avg_x = xs[next_start:next_end].mean()
+        avg_y = ys[next_start:next_end].mean()
+        area = np.abs(
+            (xs[anchor] - avg_x) * (ys[start:end] - ys[anchor])
+            - (xs[anchor] - xs[start:end]) * (avg_y - ys[anchor])
+        )
+        anchor = start + int(area.argmax())
+        selected.append(anchor)
+    selected.append(n - 1)
+    return order[selected]
+
+
+def downsample_scatter_frame(df_source: pd.DataFrame, x: str, y: str, group: str) -> pd.DataFrame:
+    """Thin out large datasets per group before building the scatter."""
+    if len(df_source) <= SCATTER_POINT_LIMIT:
+        return df_source
+
+    parts = []
+    for _, subset in df_source.dropna(subset=[x, y]).groupby(group, sort=False, observed=True):
+        positions = lttb_indices(subset[x].to_numpy(), subset[y].to_numpy(), SCATTER_POINTS_PER_GROUP)
+        parts.append(subset.iloc[np.sort(positions)])
+    return pd.concat(parts) if parts else df_source
 
 
 def build_scatter_figure(df_source: pd.DataFrame):
@@ -74,22 +391,32 @@ def build_scatter_figure(df_source: pd.DataFrame):
     по полу/возрасту, мы строго проверяем наличие необходимых колонок,
     чтобы не вводить врача в заблуждение неполными графиками.
     """
-    required_cols = {'Эритроциты', 'Гемоглобин', 'Пол', 'Возраст'}
-    if not required_cols.issubset(df_source.columns):
+    columns = frozenset(df_source.columns)
+    if not columns.issuperset(SCATTER_REQUIRED_COLUMNS):
         fig = px.scatter(template='plotly_white')
         fig.update_layout(title='Загрузите анализы, чтобы построить диаграмму')
         return fig
 
+    df_source = downsample_scatter_frame(df_source, 'Эритроциты', 'Гемоглобин', 'Пол')
+    # Если и после прореживания точек слишком много, подсказки отключаются:
+    # браузер иначе перебирает все точки при каждом движении мыши.
+    many_points = len(df_source) > SCATTER_POINT_LIMIT
+    hover_columns = None
+    if not many_points and columns.issuperset(SCATTER_HOVER_COLUMNS):
+        hover_columns = list(SCATTER_HOVER_COLUMNS)
     fig = px.scatter(
         df_source,
         x='Эритроциты',
         y='Гемоглобин',
         color='Пол',
         size='Возраст',
-        hover_data=['Тромбоциты', 'Лейкоциты'] if {'Тромбоциты', 'Лейкоциты'}.issubset(df_source.columns) else None,
+        hover_data=hover_columns,
         title='Correlation between кол-во эритроцитов and Гемоглобин',
-        template='plotly_white'
+        template='plotly_white',
+        render_mode='webgl'
     )
+    if many_points:
+        fig.update_traces(hoverinfo='skip', hovertemplate=None)
     fig.update_xaxes(title=r"Эритроциты (10^6 mu / L)")
     fig.update_yaxes(title=r"Гемоглобин (g/dL)")
     return fig
@@ -109,7 +436,12 @@ for base_name in ('blood_count_dataset', 'анализ_крови'):
     for ext in ('.csv', '.xlsx'):
         candidate = DATA_DIR / f"{base_name}{ext}"
         if candidate.exists():
-            blood_df = read_tabular_file(candidate).reset_index(drop=True)
+            blood_source = read_data_file(candidate)
+            if not blood_source.index.equals(pd.RangeIndex(len(blood_source))):
+                blood_source = blood_source.reset_index(drop=True)
+            # Поверхностная копия: compact_blood_frame заменяет колонки
+            # целиком, и кэшированный оригинал не меняется.
+            blood_df = compact_blood_frame(blood_source.copy(deep=False))
             break
     if blood_df is not None:
         break
@@ -117,11 +449,17 @@ for base_name in ('blood_count_dataset', 'анализ_крови'):
 if blood_df is None:
     print("Error: 'blood_count_dataset.(csv|xlsx)' or 'анализ_крови.(csv|xlsx)' not found in the data directory.")
     exit()
-
-df['Пол'] = df['Пол'].astype(str)
-df['Пол_Norm'] = df['Пол'].str.lower().str.strip()
-df['Возраст_Str'] = df['Возраст'].astype(str)
-df['Patient_Key'] = df['ID']
+# Разобранные файлы нужны только на старте; данные уже скопированы в df.
+_parse_file.cache_clear()
+
+coerce_numeric_columns(df, GAUGE_COLUMNS)
+ensure_contiguous_columns(df, GAUGE_COLUMNS)
+ensure_contiguous_columns(blood_df, numerical_cols)
+# Пол, ключ пациента и Source_File (см. `load_all_datasets`) хранятся как
+# категории: компактные коды вместо строки на каждую строку таблицы, а
+# группировки и сравнения идут по целым числам.
+df['Пол'] = df['Пол'].astype(str).astype('category')
+df['Patient_Key'] = df['ID'].astype('category')
 
 patient_options = build_patient_options(df)
 if 'Гемоглобин' in blood_df.columns:
@@ -129,28 +467,61 @@ if 'Гемоглобин' in blood_df.columns:
 else:
     numeric_candidates = [col for col in numerical_cols if col in blood_df.columns]
     default_metric = numeric_candidates[0] if numeric_candidates else blood_df.columns[0]
-global_scatter_fig = build_scatter_figure(blood_df)
+# Figure обходится и превращается в dict один раз; браузер получает готовый JSON.
+global_scatter_fig = serialize_figure(build_scatter_figure(blood_df))
 
 # initialize Dash
-app = Dash(__name__)
+# Layout, фигуры и ответы коллбеков — повторяющийся JSON; Dash сжимает их
+# через Flask-Compress (gzip/brotli по Accept-Encoding), если он установлен.
+app = Dash(__name__, compress=COMPRESS_RESPONSES)
 server = app.server
+if orjson is not None:
+    server.json = OrjsonProvider(server)
+
+
+@server.after_request
+def cache_static_dash_routes(response):
+    if request.method == 'GET' and response.status_code == 200 and request.path.endswith(CACHEABLE_DASH_ROUTES):
+        response.headers['Cache-Control'] = DASH_ROUTES_CACHE_CONTROL
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+
+def json_resource(payload):
+    """Flask view that serves `payload` encoded to JSON once.
+
+    Общие для всех сессий фигуры (scatter, box-plot) отдаются как
+    статические ресурсы: браузер хранит их и перепроверяет по ETag,
+    получая 304 без тела, пока данные не изменились.
+    """
+    body = server.json.dumps(payload)
+    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+    def view():
+        response = Response(body, mimetype='application/json')
+        response.headers['Cache-Control'] = DASH_ROUTES_CACHE_CONTROL
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    return view
+
+
+server.add_url_rule(SCATTER_FIGURE_URL, 'global_scatter_figure', json_resource(global_scatter_fig))
+server.add_url_rule(BOX_PLOTS_URL, 'box_plots', json_resource(build_box_plot_payload(blood_df)))
+
 
 # --- 3. Define the Layout ---
 app.layout = html.Div(
     style={'backgroundColor': '#000000', 'padding': '20px', 'minHeight': '100vh'},
     children=[
         dcc.Store(id='auth-store', data={'authorized': False}),
-        dcc.Store(id='patient-data-store', data=[]),
         dcc.Store(id='selected-metric', data=default_metric),
 
         # Registration/Login Block
         build_login_section(),
 
         # Dashboard Block (hidden until login)
-        build_dashboard_container(
-            patient_options,
-            global_scatter_fig
-        )
+        build_dashboard_container(patient_options)
     ]
 )
 
@@ -1,7 +1,29 @@
+import numpy as np
 import pandas as pd
+from dash import Dash
 
-from src.dashboard import build_patient_options
-from src.main import build_scatter_figure
+from src.dashboard import (
+    _json_values,
+    build_box_plot_payload,
+    build_display_column_map,
+    build_patient_options,
+    format_frame,
+    group_patient_sources,
+    positive_diagnosis_mask,
+    register_dashboard_callbacks,
+    summarize_box
+)
+from src import main
+from src.main import (
+    build_scatter_figure,
+    cached_read,
+    coerce_numeric_columns,
+    compact_blood_frame,
+    concat_frames,
+    load_all_datasets,
+    downsample_scatter_frame,
+    lttb_indices
+)
 
 
 def test_build_patient_options_returns_unique_ids():
@@ -18,6 +40,113 @@ def test_build_patient_options_returns_unique_ids():
     assert options[1]['label'] == 'Пациент: ID 2'
 
 
+def test_build_patient_options_skips_missing_ids():
+    df = pd.DataFrame({'ID': [1, None, 1, 3]})
+
+    options = build_patient_options(df)
+
+    assert [option['value'] for option in options] == [1.0, 3.0]
+
+
+def test_build_display_column_map_drops_service_and_missing_columns():
+    source_column_map = {
+        'анализ_крови.csv': ['ID', 'Имя', 'Гемоглобин', 'Лейкоциты', 'СОЭ'],
+        'анализ_мочи.csv': ['ID', 'Color', 'Диагноз']
+    }
+
+    display_map = build_display_column_map(source_column_map, ['ID', 'Имя', 'Гемоглобин', 'Лейкоциты', 'Color', 'Диагноз'])
+
+    assert display_map['анализ_крови.csv'] == ['Лейкоциты']
+    assert display_map['анализ_мочи.csv'] == ['Color', 'Диагноз']
+
+
+def test_group_patient_sources_orders_rows_by_date_descending():
+    df = pd.DataFrame({
+        'Patient_Key': [1, 1, 2, 1],
+        'Source_File': ['анализ_мочи.csv', 'анализ_крови.csv', 'анализ_крови.csv', 'анализ_крови.csv'],
+        'Дата': ['2020-01-01', '2020-01-01', '2020-05-05', '2020-03-03']
+    })
+
+    source_index = group_patient_sources(df)
+
+    assert list(source_index[1]) == ['анализ_крови.csv', 'анализ_мочи.csv']
+    blood_rows = source_index[1]['анализ_крови.csv']
+    assert blood_rows['Дата'].tolist() == ['2020-03-03', '2020-01-01']
+    assert len(source_index[2]) == 1
+
+
+def test_format_frame_matches_card_formatting():
+    df = pd.DataFrame({
+        'Лейкоциты': [7600.0, None],
+        'Возраст': [38, 40],
+        'Диагноз': ['NEGATIVE', None]
+    })
+
+    formatted = format_frame(df)
+
+    assert formatted['Лейкоциты'].tolist() == ['7600.00', 'N/A']
+    assert formatted['Возраст'].tolist() == ['38', '40']
+    assert formatted['Диагноз'].tolist() == ['NEGATIVE', 'N/A']
+
+
+def test_positive_diagnosis_mask_normalizes_case_and_skips_missing():
+    df = pd.DataFrame({'Диагноз': [' positive', 'NEGATIVE', None, 'POSITIVE']})
+
+    assert positive_diagnosis_mask(df).tolist() == [True, False, False, True]
+    assert positive_diagnosis_mask(pd.DataFrame({'Диагноз': [np.nan]})).tolist() == [False]
+    assert positive_diagnosis_mask(pd.DataFrame({'ID': [1]})) is None
+
+
+def test_json_values_maps_missing_values_to_none():
+    dates = pd.Series(['2020-01-01', None], dtype='string').to_numpy()
+
+    assert _json_values(dates) == ['2020-01-01', None]
+    assert _json_values(np.array([1.5, np.nan])) == [1.5, None]
+
+
+def test_metric_history_plots_datetime_dates_in_chronological_order():
+    df = pd.DataFrame({
+        'ID': [1, 1, 1],
+        'Дата': pd.to_datetime(['2021-03-04', '2020-01-01', None]),
+        'Гемоглобин': [14.0, 12.5, 13.0],
+        'Source_File': ['анализ_крови.xlsx'] * 3
+    })
+    df['Patient_Key'] = df['ID'].astype('category')
+    app = register_dashboard_callbacks(Dash(__name__), df, {'анализ_крови.xlsx': list(df.columns)}, df)
+    toggle = next(
+        entry['callback'].__wrapped__ for key, entry in app.callback_map.items() if 'gauge-plot' in key
+    )
+
+    figure, style = toggle(1, 1, {'source': 'анализ_крови.xlsx', 'metric': 'Гемоглобин', 'row': 'x'})
+
+    assert style['display'] == 'block'
+    assert figure['data'][0]['x'] == ['2020-01-01T00:00:00', '2021-03-04T00:00:00', None]
+    assert figure['data'][0]['y'] == [12.5, 14.0, 13.0]
+
+
+def test_summarize_box_computes_quartiles_fences_and_outliers():
+    stats = summarize_box([1, 2, 3, 4, 5, 6, 7, 8, 100, float('nan')])
+
+    assert stats['q1'] == 2.75
+    assert stats['median'] == 5
+    assert stats['q3'] == 7.25
+    assert stats['lowerfence'] == 1
+    assert stats['upperfence'] == 8
+    assert stats['outliers'] == [100]
+    assert summarize_box([float('nan')]) is None
+
+
+def test_build_box_plot_payload_covers_numeric_columns_and_fallback():
+    df = pd.DataFrame({'Гемоглобин': [12.0, 13.0, 14.0, 15.0], 'Пол': ['F', 'F', 'M', 'M'], 'Имя': list('АБВГ')})
+
+    payload = build_box_plot_payload(df)
+
+    assert list(payload['figures']) == ['Гемоглобин']
+    assert payload['figures']['Гемоглобин']['header'] == 'Boxplot: Гемоглобин'
+    assert len(payload['figures']['Гемоглобин']['figure']['data']) == 2
+    assert payload['fallback']['header'].startswith('Выберите показатель')
+
+
 def test_build_scatter_figure_builds_plot_for_complete_data():
     df = pd.DataFrame({
         'ID': [1, 1],
@@ -32,13 +161,101 @@ def test_build_scatter_figure_builds_plot_for_complete_data():
 
     assert len(fig.data) == 1
     scatter = fig.data[0]
+    assert scatter.type == 'scattergl'
     assert list(scatter.x) == [4.5, 5.0]
     assert list(scatter.y) == [13.2, 14.1]
 
 
+def test_coerce_numeric_columns_parses_decimal_commas():
+    df = pd.DataFrame({'Гемоглобин': ['12,4', '13.1', 'н/д'], 'Имя': ['А', 'Б', 'В']})
+
+    coerce_numeric_columns(df, ['Гемоглобин', 'Тромбоциты'])
+
+    assert df['Гемоглобин'].tolist()[:2] == [12.4, 13.1]
+    assert pd.isna(df['Гемоглобин'].iloc[2])
+    assert df['Имя'].tolist() == ['А', 'Б', 'В']
+
+
+def test_concat_frames_matches_pd_concat_for_mixed_schemas():
+    blood = pd.DataFrame({'ID': [1, 2], 'Гемоглобин': [13.2, 14.1], 'Source_File': ['a.csv', 'a.csv']})
+    urine = pd.DataFrame({'ID': [3], 'Диагноз': ['POSITIVE'], 'Source_File': ['b.csv']})
+
+    combined = concat_frames([blood, urine])
+
+    pd.testing.assert_frame_equal(combined, pd.concat([blood, urine], ignore_index=True))
+
+
+def test_cached_read_rebuilds_cache_when_parser_version_changes(tmp_path, monkeypatch):
+    source = tmp_path / 'анализ_мочи.csv'
+    source.write_text('ID,Дата,Диагноз\n1,2020-01-01,POSITIVE\n', encoding='utf-8')
+
+    first = cached_read(source)
+    old_cache = main.parquet_cache_path(source)
+    monkeypatch.setattr(main, 'PARQUET_CACHE_VERSION', main.PARQUET_CACHE_VERSION + 1)
+    second = cached_read(source)
+
+    pd.testing.assert_frame_equal(first, second)
+    if main.CSV_ENGINE == 'pyarrow':
+        assert main.parquet_cache_path(source) != old_cache
+        assert [path.name for path in tmp_path.glob('*.parquet')] == [main.parquet_cache_path(source).name]
+
+
+def test_load_all_datasets_orders_mixed_csv_and_xlsx_sources_alphabetically(tmp_path, monkeypatch):
+    frames = {
+        'анализ_мочи.csv': pd.DataFrame({'ID': [1], 'Дата': ['2020-01-01'], 'Диагноз': ['NEGATIVE']}),
+        'анализ_крови.xlsx': pd.DataFrame({'ID': [1], 'Дата': ['2020-01-01'], 'Гемоглобин': [13.2]})
+    }
+    for name in frames:
+        (tmp_path / name).touch()
+    monkeypatch.setattr(main, 'read_data_file', lambda file_path: frames[file_path.name].copy())
+
+    combined, _ = load_all_datasets(tmp_path)
+    combined['Patient_Key'] = combined['ID'].astype('category')
+
+    assert list(combined['Source_File'].cat.categories) == ['анализ_крови.xlsx', 'анализ_мочи.csv']
+    assert list(group_patient_sources(combined)[1]) == ['анализ_крови.xlsx', 'анализ_мочи.csv']
+    assert combined.loc[combined['Гемоглобин'].notna(), 'Source_File'].tolist() == ['анализ_крови.xlsx']
+
+
+def test_compact_blood_frame_keeps_float_values_and_categorizes_gender():
+    df = pd.DataFrame({'Гемоглобин': [13.2, 4.7], 'Возраст': [30, 40], 'Пол': ['F', 'M']})
+
+    compact = compact_blood_frame(df)
+
+    assert compact['Гемоглобин'].dtype == 'float64'
+    assert compact['Гемоглобин'].tolist() == [13.2, 4.7]
+    assert compact['Возраст'].dtype == 'int64'
+    assert isinstance(compact['Пол'].dtype, pd.CategoricalDtype)
+
+
 def test_build_scatter_figure_handles_missing_columns():
     df = pd.DataFrame({'Эритроциты': [4.5], 'Гемоглобин': [13.2]})
     fig = build_scatter_figure(df)
 
     assert len(fig.data) == 1
     assert 'Загрузите анализы' in fig.layout.title.text
+
+
+def test_lttb_indices_keeps_endpoints_and_peak():
+    x = np.arange(100, dtype=float)
+    y = np.zeros(100)
+    y[37] = 50.0
+
+    positions = lttb_indices(x, y, 10)
+
+    assert len(positions) == 10
+    assert {0, 37, 99}.issubset(set(positions.tolist()))
+
+
+def test_downsample_scatter_frame_limits_points_per_group():
+    size = 6000
+    df = pd.DataFrame({
+        'Эритроциты': np.linspace(3, 6, size),
+        'Гемоглобин': np.linspace(10, 16, size),
+        'Пол': ['F', 'M'] * (size // 2)
+    })
+
+    sampled = downsample_scatter_frame(df, 'Эритроциты', 'Гемоглобин', 'Пол')
+
+    assert sampled['Пол'].value_counts().max() <= 2000
+    assert len(downsample_scatter_frame(df.head(10), 'Эритроциты', 'Гемоглобин', 'Пол')) == 10